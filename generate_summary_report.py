@@ -4,7 +4,30 @@ Generate a comprehensive summary report of the phenotype mapping tool capabiliti
 """
 
 from phenotype_mapper import PhenotypeMapper
-import json
+import re
+
+# Keyword table for grouping phenotypes; categories are tried in order
+CATEGORY_KEYWORDS = {
+    'Mental Health': ('anxiety', 'depression', 'bipolar', 'adhd', 'autism', 'ptsd', 'psychosis', 'eating'),
+    'Cardiovascular': ('cardiac', 'heart', 'hypertension', 'arrhythmia', 'af_', 'ihd', 'mi', 'aneurysm'),
+    'Diabetes/Endocrine': ('diabetes', 'thyroid', 'addison'),
+    'Cancer': ('cancer', 'ca_', 'metastatic', 'breast', 'lung', 'colon', 'prostate', 'skin'),
+    'Neurological': ('alzheimer', 'dementia', 'parkinson', 'ms_', 'epilepsy', 'migraine'),
+}
+
+# One alternation per category, so each category costs a single regex scan
+_CATEGORY_PATTERNS = [
+    (category, re.compile('|'.join(map(re.escape, keywords))))
+    for category, keywords in CATEGORY_KEYWORDS.items()
+]
+
+def categorize_phenotype(phenotype):
+    """Return the first category whose keywords appear in the phenotype name, or 'Other'."""
+    p_lower = phenotype.lower()
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(p_lower):
+            return category
+    return 'Other'
 
 def generate_report():
     """Generate comprehensive mapping report."""
@@ -24,37 +47,20 @@ def generate_report():
     print(f"ICD10 codes indexed: {stats['icd10_codes']:,}")
     print(f"SNOMED codes indexed: {stats['snomed_codes']:,}")
     print(f"ICD9 codes with mappings: {stats['icd9_codes']:,}")
-    print(f"Total ICD9-ICD10 mappings: {len(mapper.icd9_to_icd10_map):,}")
+    print(f"Total ICD9-ICD10 mappings: {stats['icd9_mappings']:,}")
     
     print(f"\n🏥 AVAILABLE PHENOTYPE CATEGORIES")
     print(f"{'─' * 40}")
     
     # Group phenotypes by category for better readability
-    phenotypes = sorted(stats['phenotype_list'])
+    # (get_phenotype_stats already returns the list sorted)
+    phenotypes = stats['phenotype_list']
     
-    categories = {
-        'Mental Health': [],
-        'Cardiovascular': [],
-        'Diabetes/Endocrine': [],
-        'Cancer': [],
-        'Neurological': [],
-        'Other': []
-    }
+    categories = {category: [] for category in CATEGORY_KEYWORDS}
+    categories['Other'] = []
     
     for phenotype in phenotypes:
-        p_lower = phenotype.lower()
-        if any(term in p_lower for term in ['anxiety', 'depression', 'bipolar', 'adhd', 'autism', 'ptsd', 'psychosis', 'eating']):
-            categories['Mental Health'].append(phenotype)
-        elif any(term in p_lower for term in ['cardiac', 'heart', 'hypertension', 'arrhythmia', 'af_', 'ihd', 'mi', 'aneurysm']):
-            categories['Cardiovascular'].append(phenotype)
-        elif any(term in p_lower for term in ['diabetes', 'thyroid', 'addison']):
-            categories['Diabetes/Endocrine'].append(phenotype)
-        elif any(term in p_lower for term in ['cancer', 'ca_', 'metastatic', 'breast', 'lung', 'colon', 'prostate', 'skin']):
-            categories['Cancer'].append(phenotype)
-        elif any(term in p_lower for term in ['alzheimer', 'dementia', 'parkinson', 'ms_', 'epilepsy', 'migraine']):
-            categories['Neurological'].append(phenotype)
-        else:
-            categories['Other'].append(phenotype)
+        categories[categorize_phenotype(phenotype)].append(phenotype)
     
     for category, items in categories.items():
         if items:
@@ -8,44 +8,515 @@ based on the available phenotype categories in the Medical conditions folder.
 Author: Generated with Claude Code
 """
 
+import bisect
 import csv
+import functools
+import hashlib
 import json
 import os
+import pickle
 import re
+import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import zip_longest
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Set
 import argparse
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json module
+    orjson = None
+
+
+def _json_dumps(data) -> str:
+    """
+    Serialize data to an indented JSON string, using orjson when available.
+    
+    Args:
+        data: JSON-serializable data
+        
+    Returns:
+        JSON text
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def _write_json(data, output_file: str):
+    """
+    Write data to a UTF-8 JSON file, using orjson when available.
+    
+    Args:
+        data: JSON-serializable data
+        output_file: Path to output file
+    """
+    if orjson is not None:
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+# Code format patterns used by PhenotypeMapper._detect_code_type
+_ICD10_RE = re.compile(r'^[A-Z]\d{2}(?:\.\d+)?$')
+_ICD9_RE = re.compile(r'^(?:\d{3}(?:\.\d+)?|[VE]\d{2}(?:\.\d+)?)$')
+_SNOMED_RE = re.compile(r'^\d{6,18}$')
+_BIRM_CAM_RE = re.compile(r'_birm_cam.*$')
+
+
+@functools.lru_cache(maxsize=None)
+def _pyarrow_csv():
+    """
+    Import pyarrow.csv on first use.
+    
+    pyarrow is optional and slow to import, so it is only loaded once a
+    CSV actually needs parsing (never on a cache hit).
+    
+    Returns:
+        The pyarrow.csv module, or None if pyarrow is not installed
+    """
+    try:
+        import pyarrow.csv as pa_csv
+    except ImportError:  # pyarrow is optional; fall back to the stdlib csv module
+        return None
+    return pa_csv
+
+
+def _read_csv_columns(file_path: Path, columns: List[str], required: str) -> Optional[Dict[str, List[str]]]:
+    """
+    Read selected columns of a CSV file as parallel lists of strings.
+    
+    Uses the multithreaded pyarrow CSV reader when available, otherwise
+    (or when pyarrow rejects the file, e.g. for rows with extra fields)
+    transposes csv.reader rows. Columns missing from the header are
+    returned as lists of empty strings.
+    
+    Args:
+        file_path: Path to the CSV file
+        columns: Names of the columns to read
+        required: Column that must be present for the file to be read
+        
+    Returns:
+        Dictionary of column name -> list of values, or None if the
+        required column is missing
+    """
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f), [])
+    if required not in header:
+        return None
+    present = [c for c in columns if c in header]
+    
+    data = None
+    pa_csv = _pyarrow_csv()
+    if pa_csv is not None:
+        import pyarrow as pa
+        try:
+            # Read everything as strings so codes keep their leading zeros
+            table = pa_csv.read_csv(
+                file_path,
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=present,
+                    column_types={c: pa.string() for c in present},
+                    strings_can_be_null=False
+                )
+            )
+        except pa.ArrowInvalid:
+            # Ragged rows are rejected by pyarrow; re-read with csv.reader
+            # so the index is the same whether or not pyarrow is installed
+            pass
+        else:
+            num_rows = table.num_rows
+            data = {c: table.column(c).to_pylist() for c in present}
+    
+    if data is None:
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            all_columns = list(zip_longest(*reader, fillvalue=''))
+        num_rows = len(all_columns[0]) if all_columns else 0
+        data = {}
+        for c in present:
+            i = header.index(c)
+            data[c] = list(all_columns[i]) if i < len(all_columns) else [''] * num_rows
+    
+    for c in columns:
+        if c not in data:
+            data[c] = [''] * num_rows
+    return data
+
+
+# Bump when the layout of the cached state changes so old cache files are ignored
+_CACHE_VERSION = 6
+
+# Number of distinct (code, code type) results kept by PhenotypeMapper.map_code
+_MAP_CODE_CACHE_SIZE = 65536
+
+# Below this many folders the process pool costs more than it saves
+_PARALLEL_MIN_FOLDERS = 8
+
+
+def _process_csv_file(file_path: Path, phenotype_name: str, code_type: str) -> List[Tuple[str, str, str, str]]:
+    """
+    Process a single CSV file and extract medical codes.
+    
+    Args:
+        file_path: Path to the CSV file
+        phenotype_name: Name of the phenotype category
+        code_type: Type of medical code (icd10, snomed, etc.)
+        
+    Returns:
+        List of (code_type, code, phenotype, description) tuples
+    """
+    rows = []
+    try:
+        columns = _read_csv_columns(file_path,
+                                    ['MEDICAL_CODE_ID', 'DESCRIPTION', 'SNOMED_CT_CODE'],
+                                    required='MEDICAL_CODE_ID')
+        if columns is None:
+            return rows
+        
+        append = rows.append
+        index_snomed = code_type == 'snomed'
+        
+        for medical_code, description, snomed_code in zip(
+                columns['MEDICAL_CODE_ID'], columns['DESCRIPTION'], columns['SNOMED_CT_CODE']):
+            # Extract the main medical code
+            medical_code = medical_code.strip()
+            if not medical_code:
+                continue
+            description = description.strip()
+            append((code_type, medical_code, phenotype_name, description))
+            
+            # For SNOMED files, also index the SNOMED code if present
+            if index_snomed:
+                snomed_code = snomed_code.strip()
+                if snomed_code:
+                    append((code_type, snomed_code, phenotype_name, description))
+                        
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+    
+    return rows
+
+
+def _process_folder(folder: Path, phenotype_name: str) -> List[Tuple[str, str, str, str]]:
+    """
+    Extract medical codes from all CSV files in a phenotype folder.
+    
+    Module-level so it can be dispatched to worker processes.
+    
+    Args:
+        folder: Path to the phenotype folder
+        phenotype_name: Name of the phenotype category
+        
+    Returns:
+        List of (code_type, code, phenotype, description) tuples
+    """
+    rows = []
+    
+    # Process ICD10 files
+    icd10_file = folder / f"{folder.name}_ICD10.csv"
+    if icd10_file.exists():
+        rows.extend(_process_csv_file(icd10_file, phenotype_name, 'icd10'))
+    
+    # Process SNOMED files (CPRD_AURUM contains SNOMED codes)
+    snomed_files = [
+        folder / f"{folder.name}_CPRD_AURUM.csv",
+        folder / f"{folder.name}_CPRD_GOLD.csv",
+        folder / f"{folder.name}_IMRD.csv"
+    ]
+    
+    for snomed_file in snomed_files:
+        if snomed_file.exists():
+            rows.extend(_process_csv_file(snomed_file, phenotype_name, 'snomed'))
+    
+    return rows
+
+
+def _mapping_result(input_code: str, formatted_code: str, code_type: str, phenotypes: Optional[List[str]] = None,
+                    description: str = '', match_type: str = 'none', confidence: float = 0.0,
+                    mapping_path: str = '', approximate_match: bool = False) -> Dict:
+    """
+    Build a mapping result dictionary in a single allocation.
+    
+    The defaults describe a code with no match.
+    
+    Args:
+        input_code: The stripped input code
+        formatted_code: The code in standard format for its type
+        code_type: Detected or requested code type
+        phenotypes: Matching phenotype names
+        description: Description of the matched code
+        match_type: 'direct', 'mapped', 'partial' or 'none'
+        confidence: Confidence score of the match
+        mapping_path: Human-readable description of how the match was made
+        approximate_match: Whether an approximate GEM mapping was used
+    
+    Returns:
+        Dictionary containing mapping results
+    """
+    return {
+        'input_code': input_code,
+        'formatted_code': formatted_code,
+        'detected_type': code_type,
+        'phenotypes': phenotypes if phenotypes is not None else [],
+        'description': description,
+        'match_type': match_type,
+        'confidence': confidence,
+        'mapping_path': mapping_path,
+        'approximate_match': approximate_match
+    }
+
+
+# Shared template for a code with no match; copied, never returned as-is
+_EMPTY_RESULT = _mapping_result('', '', '')
+
+
+def _copy_result(result: Dict) -> Dict:
+    """
+    Copy a mapping result so a shared (cached) result cannot be mutated by callers.
+    
+    Args:
+        result: Mapping result dictionary
+        
+    Returns:
+        Copy of the result with its own phenotypes list
+    """
+    return dict(result, phenotypes=list(result['phenotypes']))
+
+
 class PhenotypeMapper:
     """
     Main class for mapping medical codes to phenotype categories.
+    
+    ICD9 data is loaded lazily from the mapping file the first time it is
+    needed (mapping an ICD9 code, get_phenotype_stats or export_mappings).
+    The icd9_to_icd10_map and icd10_to_icd9_map properties trigger that
+    load themselves; phenotype_index['icd9'] stays empty until then.
+    icd10_to_icd9_map is a defaultdict(set) whether it was built from the
+    mapping file or loaded from the on-disk cache.
     """
     
-    def __init__(self, data_dir: str = "Medical conditions", mapping_file: str = "icd10toicd9gem.csv"):
+    def __init__(self, data_dir: str = "Medical conditions", mapping_file: str = "icd10toicd9gem.csv",
+                 use_cache: bool = True):
         """
         Initialize the phenotype mapper.
         
         Args:  
             data_dir: Path to the directory containing phenotype CSV files
             mapping_file: Path to ICD9-ICD10 mapping file
+            use_cache: Load/store the parsed index in a pickle cache inside data_dir
         """
         self.data_dir = Path(data_dir)
         self.mapping_file = Path(mapping_file)
         self.phenotype_index = {
             'icd10': defaultdict(set),
             'snomed': defaultdict(set), 
-            'icd9': defaultdict(set)  # Will be populated from mapping files
+            'icd9': defaultdict(set)  # Populated from the mapping file on first use
         }
         self.phenotype_descriptions = {}
         self.code_descriptions = {}
-        self.icd9_to_icd10_map = {}  # ICD9 -> ICD10 mapping
-        self.icd10_to_icd9_map = defaultdict(set)  # ICD10 -> set of ICD9 codes
+        self._icd9_to_icd10_map = {}  # ICD9 -> ICD10 mapping
+        self._icd10_to_icd9_map = defaultdict(set)  # ICD10 -> set of ICD9 codes
+        # ICD9 descriptions inherited from ICD10, kept apart from code_descriptions
+        # so the lazy ICD9 load never changes results for other code types
+        self._icd9_descriptions = {}
+        self._sorted_keys = {}  # code type -> sorted list of indexed codes
+        self._all_phenotypes = set()  # Phenotypes with at least one indexed code
+        self._phenotype_list = None  # Sorted copy of _all_phenotypes, built on first use
+        # Per-instance memo of map_code results; cleared when the ICD9 data is loaded
+        self._map_code_cached = functools.lru_cache(maxsize=_MAP_CODE_CACHE_SIZE)(self._map_code_impl)
+        # The ICD9-ICD10 mapping is only loaded once something needs ICD9 data
+        self._icd9_loaded = False
+        
+        self._cache_file = self._cache_path() if use_cache else None
+        if self._cache_file is None or not self._load_cache(self._cache_file):
+            # Load existing phenotype data
+            self._build_phenotype_index()
+            # The index is read-only from here on
+            self._freeze_index(['icd10', 'snomed'])
+            
+            if self._cache_file is not None:
+                self._save_cache(self._cache_file)
+        
+        self._build_sorted_keys()
+    
+    def _ensure_icd9(self):
+        """
+        Load the ICD9-ICD10 mapping and ICD9 phenotype index if not loaded yet.
+        
+        Deferred from __init__ so ICD10/SNOMED-only use never parses the GEM
+        file. The cache is rewritten afterwards so later runs get ICD9 data
+        straight from the cache.
+        """
+        if self._icd9_loaded:
+            return
         
-        # Load existing phenotype data
-        self._build_phenotype_index()
-        # Load ICD9-ICD10 mapping
         self._load_icd9_mapping()
+        self._freeze_index(['icd9'])
+        self._sorted_keys['icd9'] = sorted(self.phenotype_index['icd9'])
+        self._icd9_loaded = True
+        # ICD9 loading only adds ICD9 data, but drop memoized results anyway
+        # so nothing computed before the load can be served afterwards
+        self._map_code_cached.cache_clear()
+        
+        if self._cache_file is not None:
+            self._save_cache(self._cache_file)
+    
+    @property
+    def icd9_to_icd10_map(self) -> Dict[str, Dict]:
+        """ICD9 -> {'icd10': code, 'approximate': bool} mapping, loaded on first access."""
+        self._ensure_icd9()
+        return self._icd9_to_icd10_map
+    
+    @property
+    def icd10_to_icd9_map(self) -> Dict[str, Set[str]]:
+        """ICD10 -> set of ICD9 codes mapping (a defaultdict(set)), loaded on first access."""
+        self._ensure_icd9()
+        return self._icd10_to_icd9_map
+    
+    def _descriptions(self, code_type: str) -> Dict[str, str]:
+        """
+        Get the description lookup for a code type.
+        
+        Args:
+            code_type: Type of medical code
+            
+        Returns:
+            Dictionary of code -> description
+        """
+        return self._icd9_descriptions if code_type == 'icd9' else self.code_descriptions
+    
+    def _cache_path(self) -> Optional[Path]:
+        """
+        Get the cache file path for the current source data.
+        
+        The file name embeds a fingerprint of every phenotype CSV and the
+        mapping file (path + mtime), so any change to the inputs yields a
+        new cache file and stale caches are never read. CSV paths are taken
+        relative to the resolved data directory and the mapping file path is
+        resolved, so the same data reached through a relative path, an
+        absolute path or a symlink shares one cache file.
+        
+        Returns:
+            Path to the cache file, or None if the data directory is missing
+        """
+        if not self.data_dir.is_dir():
+            return None
+        
+        data_dir = self.data_dir.resolve()
+        sources = [
+            (p.relative_to(data_dir).as_posix(), p.stat().st_mtime_ns) for p in data_dir.rglob('*.csv')
+        ]
+        sources.append(('cache_version', _CACHE_VERSION))
+        if self.mapping_file.exists():
+            sources.append((str(self.mapping_file.resolve()), self.mapping_file.stat().st_mtime_ns))
+        cache_key = hashlib.blake2b(str(sorted(sources)).encode(), digest_size=16).hexdigest()
+        return self.data_dir / f".phenotype_cache_{cache_key}.pkl"
+    
+    def _load_cache(self, cache_file: Path) -> bool:
+        """
+        Load the parsed indices from a cache file.
+        
+        Args:
+            cache_file: Path to the cache file
+            
+        Returns:
+            True if the cache was loaded, False if it is missing or unreadable
+        """
+        if not cache_file.exists():
+            return False
+        
+        # Read the whole state into locals first so a partial or malformed
+        # cache leaves this instance untouched for the rebuild
+        try:
+            with open(cache_file, 'rb') as f:
+                state = pickle.load(f)
+            
+            phenotype_index = state['phenotype_index']
+            phenotype_descriptions = state['phenotype_descriptions']
+            code_descriptions = state['code_descriptions']
+            all_phenotypes = state['all_phenotypes']
+            icd9_loaded = state['icd9_loaded']
+            # Caches written before the ICD9 mapping was first needed leave it out
+            if icd9_loaded:
+                icd9_to_icd10_map = state['icd9_to_icd10_map']
+                icd10_to_icd9_map = state['icd10_to_icd9_map']
+                icd9_descriptions = state['icd9_descriptions']
+        except Exception as e:
+            print(f"Error loading cache {cache_file}: {e}")
+            return False
+        
+        self.phenotype_index = phenotype_index
+        self.phenotype_descriptions = phenotype_descriptions
+        self.code_descriptions = code_descriptions
+        self._all_phenotypes = all_phenotypes
+        if icd9_loaded:
+            self._icd9_to_icd10_map = icd9_to_icd10_map
+            self._icd10_to_icd9_map = defaultdict(set, icd10_to_icd9_map)
+            self._icd9_descriptions = icd9_descriptions
+            self._icd9_loaded = True
+        
+        print(f"Loaded phenotype index from cache {cache_file.name}")
+        return True
+    
+    def _save_cache(self, cache_file: Path):
+        """
+        Save the parsed indices to a cache file.
+        
+        Args:
+            cache_file: Path to the cache file
+        """
+        state = {
+            'phenotype_index': self.phenotype_index,
+            'phenotype_descriptions': self.phenotype_descriptions,
+            'code_descriptions': self.code_descriptions,
+            'icd9_to_icd10_map': self._icd9_to_icd10_map,
+            'icd10_to_icd9_map': dict(self._icd10_to_icd9_map),
+            'icd9_descriptions': self._icd9_descriptions,
+            'all_phenotypes': self._all_phenotypes,
+            'icd9_loaded': self._icd9_loaded
+        }
+        
+        try:
+            # Remove caches left behind by older versions of the source data
+            for old_cache in self.data_dir.glob('.phenotype_cache_*.pkl'):
+                old_cache.unlink()
+            
+            tmp_file = cache_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            print(f"Error writing cache {cache_file}: {e}")
+    
+    def _freeze_index(self, code_types: List[str]):
+        """
+        Replace the per-code phenotype sets with sorted tuples.
+        
+        Once the index is built it is only read, and a small tuple is far
+        cheaper to store and iterate than a set with its own hash table.
+        
+        Args:
+            code_types: Code types whose index is complete
+        """
+        for code_type in code_types:
+            self.phenotype_index[code_type] = {
+                code: tuple(sorted(phenotypes)) for code, phenotypes in self.phenotype_index[code_type].items()
+            }
+    
+    def _build_sorted_keys(self):
+        """
+        Sort the indexed codes of each code type so prefix lookups can bisect
+        instead of scanning every key.
+        """
+        self._sorted_keys = {
+            code_type: sorted(code_dict) for code_type, code_dict in self.phenotype_index.items()
+        }
     
     def _extract_phenotype_name(self, folder_name: str) -> str:
         """
@@ -57,7 +528,7 @@ class PhenotypeMapper:
         Returns:
             Clean phenotype name
         """
-        return re.sub(r'_birm_cam.*$', '', folder_name)
+        return _BIRM_CAM_RE.sub('', folder_name)
     
     def _build_phenotype_index(self):
         """
@@ -73,24 +544,31 @@ class PhenotypeMapper:
         phenotype_folders = [d for d in self.data_dir.iterdir() 
                            if d.is_dir() and '_birm_cam' in d.name]
         
-        for folder in phenotype_folders:
-            phenotype_name = self._extract_phenotype_name(folder.name)
-            
-            # Process ICD10 files
-            icd10_file = folder / f"{folder.name}_ICD10.csv"
-            if icd10_file.exists():
-                self._process_csv_file(icd10_file, phenotype_name, 'icd10')
-            
-            # Process SNOMED files (CPRD_AURUM contains SNOMED codes)
-            snomed_files = [
-                folder / f"{folder.name}_CPRD_AURUM.csv",
-                folder / f"{folder.name}_CPRD_GOLD.csv",
-                folder / f"{folder.name}_IMRD.csv"
-            ]
-            
-            for snomed_file in snomed_files:
-                if snomed_file.exists():
-                    self._process_csv_file(snomed_file, phenotype_name, 'snomed')
+        # Intern names so every code's phenotype set shares one string object per phenotype
+        phenotype_names = [sys.intern(self._extract_phenotype_name(folder.name)) for folder in phenotype_folders]
+        
+        # Hoist lookups out of the merge loop
+        phenotype_index = self.phenotype_index
+        code_descriptions = self.code_descriptions
+        phenotype_descriptions = self.phenotype_descriptions
+        
+        # Folders are independent, so parse them in worker processes and merge here
+        if len(phenotype_folders) >= _PARALLEL_MIN_FOLDERS and (os.cpu_count() or 1) > 1:
+            with ProcessPoolExecutor() as executor:
+                folder_rows = list(executor.map(_process_folder, phenotype_folders, phenotype_names, chunksize=4))
+        else:
+            folder_rows = map(_process_folder, phenotype_folders, phenotype_names)
+        
+        all_phenotypes = self._all_phenotypes
+        
+        for phenotype_name, rows in zip(phenotype_names, folder_rows):
+            if rows:
+                all_phenotypes.add(phenotype_name)
+            # Rows from worker processes carry unpickled copies of the name; use the interned one
+            for code_type, code, _, description in rows:
+                phenotype_index[code_type][code].add(phenotype_name)
+                code_descriptions[code] = description
+                phenotype_descriptions[code] = phenotype_name
         
         print(f"Indexed {len(self.phenotype_index['icd10'])} ICD10 codes")
         print(f"Indexed {len(self.phenotype_index['snomed'])} SNOMED codes")
@@ -107,46 +585,75 @@ class PhenotypeMapper:
         print("Loading ICD9-ICD10 mapping...")
         
         try:
-            with open(self.mapping_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
+            columns = _read_csv_columns(self.mapping_file,
+                                        ['icd10cm', 'icd9cm', 'approximate', 'no_map'],
+                                        required='icd10cm')
+            if columns is None:
+                print(f"Warning: {self.mapping_file} has no icd10cm column")
+                return
+            
+            # Format codes properly, a whole column at a time
+            icd9_formatted_codes = self._format_icd9_codes_batch(columns['icd9cm'])
+            icd10_formatted_codes = self._format_icd10_codes_batch(columns['icd10cm'])
+            
+            # Hoist lookups out of the row loop
+            icd9_to_icd10_map = self._icd9_to_icd10_map
+            icd10_to_icd9_map = self._icd10_to_icd9_map
+            
+            for icd10_formatted, icd9_formatted, approximate, no_map in zip(
+                    icd10_formatted_codes, icd9_formatted_codes, columns['approximate'], columns['no_map']):
+                # Skip if no mapping exists
+                if not icd9_formatted or not icd10_formatted or int(no_map or 0):
+                    continue
                 
-                for row in reader:
-                    icd10_code = row.get('icd10cm', '').strip()
-                    icd9_code = row.get('icd9cm', '').strip()
-                    approximate = int(row.get('approximate', 0))
-                    no_map = int(row.get('no_map', 0))
-                    
-                    # Skip if no mapping exists
-                    if no_map or not icd9_code or not icd10_code:
-                        continue
-                    
-                    # Format codes properly 
-                    icd9_formatted = self._format_icd9_code(icd9_code)
-                    icd10_formatted = self._format_icd10_code(icd10_code)
-                    
-                    # Store mappings
-                    self.icd9_to_icd10_map[icd9_formatted] = {
-                        'icd10': icd10_formatted,
-                        'approximate': bool(approximate)
-                    }
-                    self.icd10_to_icd9_map[icd10_formatted].add(icd9_formatted)
-                    
-                    # If there's a corresponding phenotype for the ICD10 code,
-                    # add the ICD9 code to the phenotype index
-                    if icd10_formatted in self.phenotype_index['icd10']:
-                        phenotypes = self.phenotype_index['icd10'][icd10_formatted]
-                        self.phenotype_index['icd9'][icd9_formatted].update(phenotypes)
-                        
-                        # Also inherit the description
-                        if icd10_formatted in self.code_descriptions:
-                            self.code_descriptions[icd9_formatted] = self.code_descriptions[icd10_formatted]
+                # Store mappings
+                icd9_to_icd10_map[icd9_formatted] = {
+                    'icd10': icd10_formatted,
+                    'approximate': bool(int(approximate or 0))
+                }
+                icd10_to_icd9_map[icd10_formatted].add(icd9_formatted)
             
-            print(f"Loaded {len(self.icd9_to_icd10_map)} ICD9-ICD10 mappings")
+            self._link_icd9_phenotypes()
+            
+            print(f"Loaded {len(self._icd9_to_icd10_map)} ICD9-ICD10 mappings")
             print(f"Indexed {len(self.phenotype_index['icd9'])} ICD9 codes with phenotype mappings")
             
         except Exception as e:
             print(f"Error loading ICD9-ICD10 mapping: {e}")
     
+    def _link_icd9_phenotypes(self):
+        """
+        Add ICD9 codes to the phenotype index via their ICD10 equivalents.
+        
+        Walks the ICD10 codes that have phenotypes, which are far fewer
+        than the rows of the GEM file, and propagates their phenotypes and
+        descriptions to every ICD9 code mapped to them.
+        
+        ICD10 codes, and the ICD9 codes mapped to each, are walked in sorted
+        order, so when an ICD9 code maps to several indexed ICD10 codes it
+        takes the description of the greatest one, and the ICD9 index (and
+        every export built from it) has the same order on every run.
+        """
+        icd9_index = self.phenotype_index['icd9']
+        code_descriptions = self.code_descriptions
+        icd9_descriptions = self._icd9_descriptions
+        icd10_to_icd9_map = self._icd10_to_icd9_map
+        icd10_index = self.phenotype_index['icd10']
+        
+        for icd10_code in sorted(icd10_index):
+            phenotypes = icd10_index[icd10_code]
+            icd9_codes = icd10_to_icd9_map.get(icd10_code)
+            if not icd9_codes:
+                continue
+            
+            description = code_descriptions.get(icd10_code)
+            for icd9_code in sorted(icd9_codes):
+                icd9_index[icd9_code].update(phenotypes)
+                
+                # Also inherit the description
+                if description is not None:
+                    icd9_descriptions[icd9_code] = description
+    
     def _format_icd9_code(self, code: str) -> str:
         """
         Format ICD9 code to standard format.
@@ -189,39 +696,71 @@ class PhenotypeMapper:
         else:
             return code
     
-    def _process_csv_file(self, file_path: Path, phenotype_name: str, code_type: str):
+    def _format_icd9_codes_batch(self, codes: List[str]) -> List[str]:
         """
-        Process a single CSV file and extract medical codes.
+        Format a list of ICD9 codes to standard format.
+        
+        Equivalent to calling _format_icd9_code on each code, without the
+        per-code method call overhead.
         
         Args:
-            file_path: Path to the CSV file
-            phenotype_name: Name of the phenotype category
-            code_type: Type of medical code (icd10, snomed, etc.)
+            codes: Raw ICD9 codes
+            
+        Returns:
+            Formatted ICD9 codes
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                
-                for row in reader:
-                    # Extract the main medical code
-                    medical_code = row.get('MEDICAL_CODE_ID', '').strip()
-                    description = row.get('DESCRIPTION', '').strip()
-                    snomed_code = row.get('SNOMED_CT_CODE', '').strip()
-                    
-                    if medical_code:
-                        # Add to appropriate index
-                        self.phenotype_index[code_type][medical_code].add(phenotype_name)
-                        self.code_descriptions[medical_code] = description
-                        self.phenotype_descriptions[medical_code] = phenotype_name
-                        
-                        # For SNOMED files, also index the SNOMED code if present
-                        if code_type == 'snomed' and snomed_code:
-                            self.phenotype_index['snomed'][snomed_code].add(phenotype_name)
-                            self.code_descriptions[snomed_code] = description
-                            self.phenotype_descriptions[snomed_code] = phenotype_name
-                            
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
+        return [
+            f"{code[:3]}.{code[3:]}" if len(code) >= 4 and '.' not in code and code[0] not in 'VE' else code
+            for code in map(str.strip, codes)
+        ]
+    
+    def _format_icd10_codes_batch(self, codes: List[str]) -> List[str]:
+        """
+        Format a list of ICD10 codes to standard format.
+        
+        Equivalent to calling _format_icd10_code on each code, without the
+        per-code method call overhead.
+        
+        Args:
+            codes: Raw ICD10 codes
+            
+        Returns:
+            Formatted ICD10 codes
+        """
+        return [
+            f"{code[:3]}.{code[3:]}" if len(code) >= 4 and '.' not in code else code
+            for code in map(str.upper, map(str.strip, codes))
+        ]
+    
+    def _format_codes_batch(self, codes: List[str], code_types: List[str]) -> List[str]:
+        """
+        Format a list of codes, batching the formatting by code type.
+        
+        Args:
+            codes: Stripped medical codes
+            code_types: Code type of each code
+            
+        Returns:
+            Formatted codes in input order
+        """
+        positions_by_type = defaultdict(list)
+        for i, code_type in enumerate(code_types):
+            positions_by_type[code_type].append(i)
+        
+        formatted_codes = [''] * len(codes)
+        for code_type, positions in positions_by_type.items():
+            batch = [codes[i] for i in positions]
+            if code_type == 'icd9':
+                batch = self._format_icd9_codes_batch(batch)
+            elif code_type == 'icd10':
+                batch = self._format_icd10_codes_batch(batch)
+            else:
+                batch = [code.upper() for code in batch]
+            
+            for i, formatted_code in zip(positions, batch):
+                formatted_codes[i] = formatted_code
+        
+        return formatted_codes
     
     def map_code(self, medical_code: str, code_type: str = 'auto') -> Dict:
         """
@@ -234,8 +773,19 @@ class PhenotypeMapper:
         Returns:
             Dictionary containing mapping results
         """
-        original_code = medical_code.strip()
+        return _copy_result(self._map_code_cached(medical_code.strip(), code_type))
+    
+    def _map_code_impl(self, original_code: str, code_type: str) -> Dict:
+        """
+        Map a stripped medical code to phenotype categories (uncached).
         
+        Args:
+            original_code: The stripped medical code to map
+            code_type: Type of code ('icd9', 'icd10', 'snomed', or 'auto')
+            
+        Returns:
+            Dictionary containing mapping results
+        """
         # Auto-detect code type if not specified
         if code_type == 'auto':
             code_type = self._detect_code_type(original_code)
@@ -248,64 +798,70 @@ class PhenotypeMapper:
         else:
             formatted_code = original_code.upper()
         
-        # Initialize result structure
-        result = {
-            'input_code': original_code,
-            'formatted_code': formatted_code,
-            'detected_type': code_type,
-            'phenotypes': [],
-            'description': '',
-            'match_type': 'none',
-            'confidence': 0.0,
-            'mapping_path': '',
-            'approximate_match': False
-        }
+        return self._map_formatted_code(original_code, formatted_code, code_type)
+    
+    def _map_formatted_code(self, original_code: str, formatted_code: str, code_type: str) -> Dict:
+        """
+        Map an already type-detected and formatted code to phenotype categories.
+        
+        Args:
+            original_code: The stripped input code
+            formatted_code: The code in standard format for its type
+            code_type: Type of code ('icd9', 'icd10' or 'snomed')
+            
+        Returns:
+            Dictionary containing mapping results
+        """
+        if code_type == 'icd9':
+            self._ensure_icd9()
         
         # Try direct lookup first
-        phenotypes = self.phenotype_index[code_type].get(formatted_code, set())
+        phenotypes = self.phenotype_index[code_type].get(formatted_code)
         
         if phenotypes:
-            result.update({
-                'phenotypes': list(phenotypes),
-                'description': self.code_descriptions.get(formatted_code, ''),
-                'match_type': 'direct',
-                'confidence': 1.0,
-                'mapping_path': f"{code_type} -> phenotype"
-            })
-            return result
+            return _mapping_result(
+                original_code, formatted_code, code_type,
+                phenotypes=list(phenotypes),
+                description=self._descriptions(code_type).get(formatted_code, ''),
+                match_type='direct',
+                confidence=1.0,
+                mapping_path=f"{code_type} -> phenotype"
+            )
         
         # For ICD9 codes, try mapping through ICD10
-        if code_type == 'icd9' and formatted_code in self.icd9_to_icd10_map:
-            mapping_info = self.icd9_to_icd10_map[formatted_code]
+        if code_type == 'icd9' and formatted_code in self._icd9_to_icd10_map:
+            mapping_info = self._icd9_to_icd10_map[formatted_code]
             icd10_code = mapping_info['icd10']
             approximate = mapping_info['approximate']
             
             # Look up phenotypes for the mapped ICD10 code
-            icd10_phenotypes = self.phenotype_index['icd10'].get(icd10_code, set())
+            icd10_phenotypes = self.phenotype_index['icd10'].get(icd10_code)
             
             if icd10_phenotypes:
-                result.update({
-                    'phenotypes': list(icd10_phenotypes),
-                    'description': self.code_descriptions.get(icd10_code, ''),
-                    'match_type': 'mapped',
-                    'confidence': 0.9 if not approximate else 0.7,
-                    'mapping_path': f"icd9 -> icd10 ({icd10_code}) -> phenotype",
-                    'approximate_match': approximate
-                })
-                return result
+                return _mapping_result(
+                    original_code, formatted_code, code_type,
+                    phenotypes=list(icd10_phenotypes),
+                    description=self.code_descriptions.get(icd10_code, ''),
+                    match_type='mapped',
+                    confidence=0.9 if not approximate else 0.7,
+                    mapping_path=f"icd9 -> icd10 ({icd10_code}) -> phenotype",
+                    approximate_match=approximate
+                )
         
         # Try partial matches if no direct or mapped match found
         partial_phenotypes = self._find_partial_matches(formatted_code, code_type)
         if partial_phenotypes:
-            result.update({
-                'phenotypes': list(partial_phenotypes),
-                'description': self.code_descriptions.get(formatted_code, ''),
-                'match_type': 'partial',
-                'confidence': 0.5,
-                'mapping_path': f"{code_type} -> phenotype (partial match)"
-            })
+            return _mapping_result(
+                original_code, formatted_code, code_type,
+                phenotypes=list(partial_phenotypes),
+                description=self._descriptions(code_type).get(formatted_code, ''),
+                match_type='partial',
+                confidence=0.5,
+                mapping_path=f"{code_type} -> phenotype (partial match)"
+            )
         
-        return result
+        return dict(_EMPTY_RESULT, input_code=original_code, formatted_code=formatted_code,
+                    detected_type=code_type, phenotypes=[])
     
     def _detect_code_type(self, medical_code: str) -> str:
         """
@@ -320,15 +876,15 @@ class PhenotypeMapper:
         medical_code = medical_code.strip()
         
         # ICD10 patterns: Letter followed by numbers with optional decimal
-        if re.match(r'^[A-Z]\d{2}(\.\d+)?$', medical_code):
+        if _ICD10_RE.match(medical_code):
             return 'icd10'
         
         # ICD9 patterns: Numbers with optional decimal, or V/E codes
-        if re.match(r'^(\d{3}(\.\d+)?|[VE]\d{2}(\.\d+)?)$', medical_code):
+        if _ICD9_RE.match(medical_code):
             return 'icd9'
         
         # SNOMED codes are typically long numeric strings
-        if re.match(r'^\d{6,18}$', medical_code):
+        if _SNOMED_RE.match(medical_code):
             return 'snomed'
         
         # Default fallback - try all types
@@ -346,19 +902,30 @@ class PhenotypeMapper:
             Set of matching phenotype names
         """
         matches = set()
+        index = self.phenotype_index[code_type]
         
-        # Try matching without decimal points
-        code_base = medical_code.split('.')[0]
-        if code_base in self.phenotype_index[code_type]:
-            matches.update(self.phenotype_index[code_type][code_base])
+        # Strip the decimal part; an undotted code was already looked up directly
+        if '.' in medical_code:
+            code_base = medical_code[:medical_code.index('.')]
+        else:
+            code_base = medical_code
         
-        # Try prefix matching for hierarchical codes
-        for length in [4, 3, 2]:
-            if len(code_base) > length:
-                prefix = code_base[:length]
-                for indexed_code in self.phenotype_index[code_type]:
-                    if indexed_code.startswith(prefix):
-                        matches.update(self.phenotype_index[code_type][indexed_code])
+        # Prefix matching for hierarchical codes tries prefixes of length 4, 3
+        # and 2. Every code sharing a longer prefix (including code_base
+        # itself) also shares the 2-character one, so that single contiguous
+        # run of the sorted keys is the whole union.
+        if len(code_base) > 2:
+            prefix = code_base[:2]
+            keys = self._sorted_keys[code_type]
+            i = bisect.bisect_left(keys, prefix)
+            while i < len(keys) and keys[i].startswith(prefix):
+                matches.update(index[keys[i]])
+                i += 1
+        elif code_base != medical_code:
+            # Try matching without decimal points
+            phenotypes = index.get(code_base)
+            if phenotypes:
+                matches.update(phenotypes)
         
         return matches
     
@@ -373,10 +940,72 @@ class PhenotypeMapper:
         Returns:
             List of mapping results
         """
+        original_codes = [code.strip() for code in codes]
+        
+        # Map each distinct code once; real-world extracts repeat codes heavily
+        unique_codes = list(dict.fromkeys(original_codes))
+        
+        if code_type != 'auto':
+            unique_results = self._map_codes_batch_typed(unique_codes, code_type)
+        else:
+            # Detect and format in whole-batch passes rather than per code
+            code_types = [self._detect_code_type(code) for code in unique_codes]
+            formatted_codes = self._format_codes_batch(unique_codes, code_types)
+            
+            unique_results = [
+                self._map_formatted_code(original_code, formatted_code, detected_type)
+                for original_code, formatted_code, detected_type in zip(unique_codes, formatted_codes, code_types)
+            ]
+        
+        if len(unique_codes) == len(original_codes):
+            return unique_results
+        
+        results_by_code = dict(zip(unique_codes, unique_results))
+        return [_copy_result(results_by_code[code]) for code in original_codes]
+    
+    def _map_codes_batch_typed(self, codes: List[str], code_type: str) -> List[Dict]:
+        """
+        Map a batch of codes that all share a known code type.
+        
+        Formats the whole batch with one formatter and resolves direct
+        matches inline with the index and descriptions held in locals;
+        only misses go through the full mapped/partial match logic.
+        
+        Args:
+            codes: Stripped medical codes
+            code_type: Type of all codes ('icd9', 'icd10' or 'snomed')
+            
+        Returns:
+            List of mapping results
+        """
+        if code_type == 'icd9':
+            self._ensure_icd9()
+            formatted_codes = self._format_icd9_codes_batch(codes)
+        elif code_type == 'icd10':
+            formatted_codes = self._format_icd10_codes_batch(codes)
+        else:
+            formatted_codes = [code.upper() for code in codes]
+        
+        index = self.phenotype_index[code_type]
+        code_descriptions = self._descriptions(code_type)
+        map_formatted_code = self._map_formatted_code
+        direct_path = f"{code_type} -> phenotype"
+        
         results = []
-        for code in codes:
-            result = self.map_code(code, code_type)
-            results.append(result)
+        for original_code, formatted_code in zip(codes, formatted_codes):
+            phenotypes = index.get(formatted_code)
+            if not phenotypes:
+                results.append(map_formatted_code(original_code, formatted_code, code_type))
+                continue
+            
+            results.append(_mapping_result(
+                original_code, formatted_code, code_type,
+                phenotypes=list(phenotypes),
+                description=code_descriptions.get(formatted_code, ''),
+                match_type='direct',
+                confidence=1.0,
+                mapping_path=direct_path
+            ))
         
         return results
     
@@ -387,17 +1016,20 @@ class PhenotypeMapper:
         Returns:
             Dictionary containing statistics
         """
-        all_phenotypes = set()
-        for code_dict in self.phenotype_index.values():
-            for phenotype_set in code_dict.values():
-                all_phenotypes.update(phenotype_set)
+        self._ensure_icd9()
+        
+        # ICD9 codes only inherit phenotypes from ICD10 codes, so the set
+        # collected while building the index is complete
+        if self._phenotype_list is None:
+            self._phenotype_list = sorted(self._all_phenotypes)
         
         return {
-            'total_phenotypes': len(all_phenotypes),
+            'total_phenotypes': len(self._all_phenotypes),
             'icd10_codes': len(self.phenotype_index['icd10']),
             'snomed_codes': len(self.phenotype_index['snomed']),
             'icd9_codes': len(self.phenotype_index['icd9']),
-            'phenotype_list': sorted(list(all_phenotypes))
+            'icd9_mappings': len(self._icd9_to_icd10_map),
+            'phenotype_list': list(self._phenotype_list)
         }
     
     def export_mappings(self, output_file: str, format: str = 'json'):
@@ -406,30 +1038,55 @@ class PhenotypeMapper:
         
         Args:
             output_file: Path to output file
-            format: Export format ('json' or 'csv')
+            format: Export format ('json', 'csv' or 'parquet')
         """
+        self._ensure_icd9()
+        
         if format == 'json':
-            # Convert sets to lists for JSON serialization
-            export_data = {}
-            for code_type, code_dict in self.phenotype_index.items():
-                export_data[code_type] = {
-                    code: list(phenotypes) 
-                    for code, phenotypes in code_dict.items()
-                }
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False)
+            # Phenotype tuples serialize directly as JSON lists
+            _write_json(self.phenotype_index, output_file)
         
         elif format == 'csv':
-            with open(output_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Code', 'Code_Type', 'Phenotype', 'Description'])
-                
+            def rows():
                 for code_type, code_dict in self.phenotype_index.items():
+                    descriptions = self._descriptions(code_type)
                     for code, phenotypes in code_dict.items():
-                        description = self.code_descriptions.get(code, '')
+                        description = descriptions.get(code, '')
                         for phenotype in phenotypes:
-                            writer.writerow([code, code_type, phenotype, description])
+                            yield (code, code_type, phenotype, description)
+            
+            with open(output_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Code', 'Code_Type', 'Phenotype', 'Description'])
+                writer.writerows(rows())
+        
+        elif format == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("pyarrow is required for parquet export")
+            
+            codes, code_types, phenotypes, descriptions = [], [], [], []
+            for code_type, code_dict in self.phenotype_index.items():
+                code_descriptions = self._descriptions(code_type)
+                for code, code_phenotypes in code_dict.items():
+                    description = code_descriptions.get(code, '')
+                    for phenotype in code_phenotypes:
+                        codes.append(code)
+                        code_types.append(code_type)
+                        phenotypes.append(phenotype)
+                        descriptions.append(description)
+            
+            # Rows are grouped by code type, so the low-cardinality code_type and
+            # phenotype columns compress well with dictionary + RLE encoding
+            table = pa.table({
+                'code': codes,
+                'code_type': code_types,
+                'phenotype': phenotypes,
+                'description': descriptions
+            })
+            pq.write_table(table, output_file, compression='zstd', use_dictionary=True)
 
 def main():
     """Command line interface for the phenotype mapper."""
@@ -441,17 +1098,19 @@ def main():
                        default='auto', help='Type of medical code')
     parser.add_argument('--batch-file', help='File containing codes to map (one per line)')
     parser.add_argument('--output', help='Output file for results')
-    parser.add_argument('--format', choices=['json', 'csv'], default='json',
-                       help='Output format')
+    parser.add_argument('--format', choices=['json', 'csv', 'parquet'], default='json',
+                       help='Output format (parquet requires pyarrow)')
     parser.add_argument('--stats', action='store_true', 
                        help='Show statistics about loaded data')
     parser.add_argument('--export-mappings', help='Export all mappings to file')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Rebuild the phenotype index instead of using the on-disk cache')
     
     args = parser.parse_args()
     
     # Initialize mapper
     try:
-        mapper = PhenotypeMapper(args.data_dir)
+        mapper = PhenotypeMapper(args.data_dir, use_cache=not args.no_cache)
     except FileNotFoundError as e:
         print(f"Error: {e}")
         return 1
@@ -469,7 +1128,11 @@ def main():
     
     # Export mappings if requested
     if args.export_mappings:
-        mapper.export_mappings(args.export_mappings, args.format)
+        try:
+            mapper.export_mappings(args.export_mappings, args.format)
+        except ImportError as e:
+            print(f"Error: {e}")
+            return 1
         print(f"Mappings exported to {args.export_mappings}")
         return 0
     
@@ -477,10 +1140,9 @@ def main():
     if args.code:
         result = mapper.map_code(args.code, args.code_type)
         if args.output:
-            with open(args.output, 'w') as f:
-                json.dump(result, f, indent=2)
+            _write_json(result, args.output)
         else:
-            print(json.dumps(result, indent=2))
+            print(_json_dumps(result))
         return 0
     
     # Process batch file
@@ -492,10 +1154,9 @@ def main():
             results = mapper.map_codes_batch(codes, args.code_type)
             
             if args.output:
-                with open(args.output, 'w') as f:
-                    json.dump(results, f, indent=2)
+                _write_json(results, args.output)
             else:
-                print(json.dumps(results, indent=2))
+                print(_json_dumps(results))
             
         except FileNotFoundError:
             print(f"Error: Batch file {args.batch_file} not found")